@@ -25,7 +25,6 @@ class OMMSystemABFEnoATM(OMMSystemABFE):
     def create_system(self):
 
         self.load_system()
-        self.atm_utils = AtomUtils(self.system)
         self.set_ligand_atoms()
         self.set_vsite_restraints()
         self.set_orientation_restraints()
@@ -86,8 +85,7 @@ def do_mintherm(keywords, restrain_solutes, logger):
     platform_name = keywords.get("OPENMM_PLATFORM")
     if platform_name == None:
         platform_name = "CUDA"
-    if platform_name == "CUDA" or platform_name == "OpenCL" or platform_name == "HIP":
-        platform_properties["Precision"] = "mixed"
+    platform_properties.update(syst.get_platform_properties(platform_name))
     platform = Platform.getPlatformByName(platform_name)
     
     simulation = Simulation(syst.topology, syst.system, syst.integrator, platform, platform_properties)
@@ -195,8 +193,7 @@ def do_lambda_annealing(keywords, logger):
     platform_name = keywords.get("OPENMM_PLATFORM")
     if platform_name == None:
         platform_name = "CUDA"
-    if platform_name == "CUDA" or platform_name == "OpenCL" or platform_name == "HIP":
-        platform_properties["Precision"] = "mixed"
+    platform_properties.update(syst.get_platform_properties(platform_name))
     platform = Platform.getPlatformByName(platform_name)
     
     simulation = Simulation(syst.topology, syst.system, syst.integrator, platform, platform_properties)
@@ -313,8 +310,7 @@ def do_equil(keywords, logger):
     platform_name = keywords.get("OPENMM_PLATFORM")
     if platform_name == None:
         platform_name = "CUDA"
-    if platform_name == "CUDA" or platform_name == "OpenCL" or platform_name == "HIP":
-        platform_properties["Precision"] = "mixed"
+    platform_properties.update(syst.get_platform_properties(platform_name))
     platform = Platform.getPlatformByName(platform_name)
     
     simulation = Simulation(syst.topology, syst.system, syst.integrator, platform, platform_properties)
@@ -23,7 +23,7 @@ from time import time
 # OpenMM components
 from openmm import XmlSerializer
 from openmm.app import AmberPrmtopFile, AmberInpcrdFile, PDBFile
-from openmm.app import PME, HBonds
+from openmm.app import PME, HBonds, AllBonds, HAngles
 
 from openmm.unit import Quantity
 from openmm.unit import angstrom, nanometer, nanometers, picoseconds, amu
@@ -71,8 +71,13 @@ parser.add_argument('--systemPDBoutFile', required=True, type=str, default=None,
 parser.add_argument('--hmass', required=False, type=float,
                     default=1.0,
                     help='Hydrogen mass, set it to 1.5 amu to use a 4 fs time-step')
+parser.add_argument('--constraints', required=False, type=str,
+                    default='HBonds', choices=['HBonds', 'AllBonds', 'HAngles'],
+                    help='Bonds to constrain, AllBonds with --hmass 1.5 allows time-steps up to 5 fs')
 
 # Arguments that are flags
+parser.add_argument('--flexibleWater', required=False, action='store_true',
+                    help='Do not constrain the geometry of water molecules')
 parser.add_argument('--verbose', required=False, action='store_true',
                     help='Get more output with this flag')
 
@@ -84,6 +89,8 @@ crdfile = args['AmberInpcrdinFile']
 xmloutfile = args['systemXMLoutFile']
 pdboutfile = args['systemPDBoutFile']
 hmass = float(args['hmass'])
+constraints = {'HBonds' : HBonds, 'AllBonds' : AllBonds, 'HAngles' : HAngles}[args['constraints']]
+rigidwater = not args['flexibleWater']
 
 # flag for printing (verbose) 
 flagverbose = args['verbose']
@@ -99,6 +106,8 @@ print('Amber coordinate file:           ', crdfile)
 print('Topology PDB output file:        ', pdboutfile)
 print('System XML output file:          ', xmloutfile)
 print('Hydrogen mass:                   ', hmass)  
+print('Constraints:                     ', args['constraints'])
+print('Rigid water:                     ', rigidwater)
 
 
 ############################################
@@ -110,7 +119,7 @@ print('Hydrogen mass:                   ', hmass)
 prmtop = AmberPrmtopFile(prmtopfile)
 inpcrd = AmberInpcrdFile(crdfile)
 system = prmtop.createSystem(nonbondedMethod=PME, nonbondedCutoff=0.9*nanometer,
-                                               constraints=HBonds, hydrogenMass = hmass * amu)
+                                               constraints=constraints, rigidWater = rigidwater, hydrogenMass = hmass * amu)
 
 with open(xmloutfile, 'w') as output:
     output.write(XmlSerializer.serialize(system))
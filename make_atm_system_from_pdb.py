@@ -27,7 +27,7 @@ from time import time
 from openmm import XmlSerializer
 from openmm.app import Modeller, ForceField, Simulation
 from openmm.app import PDBReporter, StateDataReporter, PDBFile
-from openmm.app import PME, HBonds
+from openmm.app import PME, HBonds, AllBonds, HAngles
 
 # from simtk.openmm import Platform, MonteCarloBarostat, LangevinMiddleIntegrator
 # from simtk.openmm import Vec3
@@ -123,8 +123,13 @@ parser.add_argument('--forcefieldJSONCachefile', required=False, type=str,
 parser.add_argument('--hmass', required=False, type=float,
                     default=1.0,
                     help='Hydrogen mass, set it to 1.5 amu to use a 4 fs time-step')
+parser.add_argument('--constraints', required=False, type=str,
+                    default='HBonds', choices=['HBonds', 'AllBonds', 'HAngles'],
+                    help='Bonds to constrain, AllBonds with --hmass 1.5 allows time-steps up to 5 fs')
 
 # Arguments that are flags
+parser.add_argument('--flexibleWater', required=False, action='store_true',
+                    help='Do not constrain the geometry of water molecules')
 parser.add_argument('--verbose', required=False, action='store_true',
                     help='Get more output with this flag')
 
@@ -160,6 +165,8 @@ ligandforcefield = args['ligandForceField']
 ffcachefile = args['forcefieldJSONCachefile']
 
 hmass = float(args['hmass'])
+constraints = {'HBonds' : HBonds, 'AllBonds' : AllBonds, 'HAngles' : HAngles}[args['constraints']]
+rigidwater = not args['flexibleWater']
 
 # flag for printing (verbose) 
 flagverbose = args['verbose']
@@ -185,6 +192,9 @@ else:
 print('Topology PDB output file:           ', pdboutfile)
 print('System XML output file:             ', xmloutfile)
 print('Force field cache file:             ', ffcachefile)
+print('Hydrogen mass:                      ', hmass)
+print('Constraints:                        ', args['constraints'])
+print('Rigid water:                        ', rigidwater)
 
 
 print('\nAvailable small molecule OpenFF force fields for ligand:')
@@ -247,7 +257,7 @@ ligmolecules = Molecule.from_file(ligandsdffile, file_format='SDF',
 print(ligmolecules)
 
 periodic_forcefield_kwargs = {'nonbondedMethod': PME, 'nonbondedCutoff': 0.9*nanometer}
-forcefield_kwargs={'constraints' : HBonds, 'rigidWater' : True,
+forcefield_kwargs={'constraints' : constraints, 'rigidWater' : rigidwater,
                    'removeCMMotion' : False, 'hydrogenMass' : hmass*amu }
 
 system_generator = SystemGenerator(forcefields=[ proteinforcefield, solventforcefield],
@@ -20,7 +20,7 @@ from openmm import XmlSerializer
 from openmm import Vec3
 from openmm.app import PDBReporter, StateDataReporter, PDBFile
 from openmm.app import ForceField, Modeller
-from openmm.app import PME, HBonds
+from openmm.app import PME, HBonds, AllBonds, HAngles
 
 # OpenFF components from the toolkit
 from openff.toolkit.topology import Molecule
@@ -138,8 +138,13 @@ parser.add_argument('--forcefieldJSONCachefile', required=False, type=str,
 parser.add_argument('--hmass', required=False, type=float,
                     default=1.0,
                     help='Hydrogen mass, set it to 1.5 amu to use a 4 fs time-step')
+parser.add_argument('--constraints', required=False, type=str,
+                    default='HBonds', choices=['HBonds', 'AllBonds', 'HAngles'],
+                    help='Bonds to constrain, AllBonds with --hmass 1.5 allows time-steps up to 5 fs')
 
 # Arguments that are flags
+parser.add_argument('--flexibleWater', required=False, action='store_true',
+                    help='Do not constrain the geometry of water molecules')
 parser.add_argument('--verbose', required=False, action='store_true',
                     help='Get more output with this flag')
 
@@ -172,6 +177,8 @@ ligandforcefield = args['ligandForceField']
 ffcachefile = args['forcefieldJSONCachefile']
 
 hmass = float(args['hmass'])
+constraints = {'HBonds' : HBonds, 'AllBonds' : AllBonds, 'HAngles' : HAngles}[args['constraints']]
+rigidwater = not args['flexibleWater']
 
 # flag for printing (verbose) 
 flagverbose = args['verbose']
@@ -193,6 +200,9 @@ if rbfe:
 print('Topology PDB output file:           ', pdboutfile)
 print('System XML output file:             ', xmloutfile)
 print('Force field cache file:             ', ffcachefile)
+print('Hydrogen mass:                      ', hmass)
+print('Constraints:                        ', args['constraints'])
+print('Rigid water:                        ', rigidwater)
 
 
 print('Call ForceField for protein and water')
@@ -375,7 +385,7 @@ print("Number of atoms in solvated system:", modeller.topology.getNumAtoms())
 print(modeller.topology)
 
 system=forcefield.createSystem(modeller.topology, nonbondedMethod = PME, nonbondedCutoff = 0.9*nanometer,
-                               constraints=HBonds, rigidWater = True, removeCMMotion = False, hydrogenMass = hmass*amu)
+                               constraints=constraints, rigidWater = rigidwater, removeCMMotion = False, hydrogenMass = hmass*amu)
 
 with open(xmloutfile, 'w') as output:
     output.write(XmlSerializer.serialize(system))
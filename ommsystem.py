@@ -4,9 +4,11 @@ from __future__ import division
 Collects all of the ways that openmm systems are loaded
 """
 import os, re, sys, time, shutil, copy, random, signal, copy
+import hashlib
 import numpy as np
 import multiprocessing as mp
 #from multiprocessing import Process, Queue, Event
+import threading
 import logging
 
 import openmm as mm
@@ -23,7 +25,16 @@ class ATMMTSLangevinIntegrator(MTSLangevinIntegrator):
     def setTemperature(self, temperature):
         self.setGlobalVariableByName('kT', MOLAR_GAS_CONSTANT_R*temperature)
 
+#parsed input files shared by all of the OMMSystem objects of a process,
+#keyed by (absolute path, modification time)
+_PDB_CACHE = {}
+_SYSTEM_XML_CACHE = {}
+_INPUT_CACHE_LOCK = threading.Lock()
+
 class OMMSystem(object):
+    #keywords that must be present in the cntl file, checked all at once when the object is created
+    _required = ('FRICTION_COEFF', 'TIME_STEP')
+
     def __init__(self, basename, keywords, pdbtopfile, systemfile, logger):
         self.system = None
         self.topology = None
@@ -53,6 +64,11 @@ class OMMSystem(object):
         self.nonbondedforcegroup = None
         self.metaDforcegroup = None
 
+        #fingerprint of the forces of the system, see kernel_signature
+        self._kernel_signature = None
+
+        self._check_keywords()
+
         self.frictionCoeff = float(self.keywords.get('FRICTION_COEFF')) / picosecond
         self.MDstepsize = float(self.keywords.get('TIME_STEP')) * picosecond
 
@@ -64,17 +80,164 @@ class OMMSystem(object):
         sys.stdout.flush()
         sys.exit(1)
 
+    def _check_keywords(self):
+        """
+        exits listing all of the required keywords that are missing,
+        before any OpenMM object is created
+        """
+        missing = [key for key in self._required if self.keywords.get(key) is None]
+        if missing:
+            self._exit("Error: missing required keywords: %s" % ", ".join(missing))
+
+    def get_platform_properties(self, platform_name):
+        """
+        returns the OpenMM platform properties set in the cntl file for the given platform,
+        to be merged with the device selection properties when creating the Context
+
+        PME_STREAM (CUDA only, default yes): OpenMM computes reciprocal space PME on a
+        separate CUDA stream so that it overlaps with direct space work. Set it to 'no' to
+        disable the separate stream on devices where this is slower (e.g. GTX 980).
+        KERNEL_CACHE_DIR (CUDA only, optional): persistent directory where OpenMM saves the
+        compiled kernels. Workers started again on a system with the same kernel_signature
+        load the kernels from there instead of compiling them.
+        PRECISION (CUDA, OpenCL and HIP, default mixed): single, mixed or double. Mixed
+        computes forces in single precision and accumulates energies and integrates in
+        double precision, which is enough for the ATM perturbation energies and much
+        faster than double on consumer GPUs.
+        """
+        properties = {}
+        if platform_name in ("CUDA", "OpenCL", "HIP"):
+            precision = self.keywords.get('PRECISION')
+            if precision is None:
+                precision = 'mixed'
+            if not isinstance(precision, str) or precision.lower() not in ('single', 'mixed', 'double'):
+                self._exit("Error: PRECISION must be single, mixed or double")
+            precision = precision.lower()
+            properties["Precision"] = precision
+        if platform_name == "CUDA":
+            pme_stream = self.keywords.get('PME_STREAM')
+            if pme_stream is not None and pme_stream.lower() == 'no':
+                properties["DisablePmeStream"] = "true"
+            cache_dir = self.keywords.get('KERNEL_CACHE_DIR')
+            if cache_dir is not None:
+                cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+                os.makedirs(cache_dir, exist_ok=True)
+                properties["TempDirectory"] = cache_dir
+        return properties
+
+    def _parse_atom_indices(self, key, required = False):
+        """
+        returns the atom indexes of a keyword as a numpy int32 array,
+        None if not set, exits if not set and required
+        """
+        values = self.keywords.get(key)
+        if values is None:
+            if required:
+                self._exit("Error: %s is required" % key)
+            return None
+        if isinstance(values, str):
+            #a single value is not parsed as a list
+            values = [values]
+        return np.fromiter(map(int, values), dtype=np.int32)
+
+    @classmethod
+    def _parse_pdb(cls, path):
+        """
+        returns the PDBFile object of a pdb file,
+        the file is parsed only once per process
+        """
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        with _INPUT_CACHE_LOCK:
+            if key not in _PDB_CACHE:
+                _PDB_CACHE[key] = PDBFile(path)
+            return _PDB_CACHE[key]
+
+    @classmethod
+    def _load_pdb(cls, path):
+        """
+        returns a copy of the topology, positions and box vectors of a pdb file
+        """
+        pdb = cls._parse_pdb(path)
+        #the caller may modify the topology, give it its own copy
+        topology = copy.deepcopy(pdb.topology)
+        positions = Quantity(list(pdb.positions.value_in_unit(nanometer)), nanometer)
+        return (topology, positions, topology.getPeriodicBoxVectors())
+
+    @classmethod
+    def _load_system_xml(cls, path):
+        """
+        returns the contents of a serialized system file,
+        the file is read only once per process
+        """
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        with _INPUT_CACHE_LOCK:
+            if key not in _SYSTEM_XML_CACHE:
+                with open(path) as input:
+                    _SYSTEM_XML_CACHE[key] = input.read()
+            return _SYSTEM_XML_CACHE[key]
+
+    def get_num_atoms(self):
+        """
+        returns the number of atoms from the pdb file without creating the system
+        """
+        return self._parse_pdb(self.pdbtopfile).topology.getNumAtoms()
+
     def load_system(self):
         """
         load the topology from a pdb file and the system from an xml file
         """
-        self.pdb = PDBFile(self.pdbtopfile)
-        self.topology = self.pdb.topology
-        self.positions = self.pdb.positions
-        self.boxvectors = self.topology.getPeriodicBoxVectors()
+        (self.topology, self.positions, self.boxvectors) = self._load_pdb(self.pdbtopfile)
         #HMASS is set in the system file
-        with open(self.systemfile) as input:
-            self.system = XmlSerializer.deserialize(input.read())
+        #the system is modified when adding forces, deserialize a new copy every time
+        self.system = XmlSerializer.deserialize(self._load_system_xml(self.systemfile))
+        if self.boxvectors is None and self.system.usesPeriodicBoundaryConditions():
+            #the pdb file has no CRYST1 record, take the box from the system file
+            self.boxvectors = self.system.getDefaultPeriodicBoxVectors()
+        self.set_nonbonded_parameters()
+
+    @property
+    def kernel_signature(self):
+        """
+        fingerprint of the complete system and of the integrator, None before create_system();
+        systems with the same signature have the same forces and differ only in the global
+        parameters set in the Context (lambdas, temperature, ...)
+
+        The system is serialized on first access only, this takes about a second for
+        100,000 atoms.
+        """
+        if self._kernel_signature is None and self.integrator is not None:
+            signature = hashlib.sha1()
+            signature.update(type(self.integrator).__name__.encode())
+            signature.update(XmlSerializer.serialize(self.system).encode())
+            self._kernel_signature = signature.hexdigest()
+        return self._kernel_signature
+
+    def set_nonbonded_parameters(self):
+        """
+        overrides the PME settings of the system file with the cntl file values, if set
+
+        NONBONDED_CUTOFF (nm): a longer cutoff shifts work from reciprocal space
+        (a coarser PME grid) to direct space
+        EWALD_ERROR_TOLERANCE: sets the PME grid spacing together with the cutoff
+        """
+        cutoff = self.keywords.get('NONBONDED_CUTOFF')
+        ewald_tol = self.keywords.get('EWALD_ERROR_TOLERANCE')
+        if cutoff is None and ewald_tol is None:
+            return
+        if cutoff is not None:
+            cutoff = float(cutoff) * nanometer
+        if ewald_tol is not None:
+            ewald_tol = float(ewald_tol)
+        for force in self.system.getForces():
+            if isinstance(force, NonbondedForce):
+                if cutoff is not None:
+                    if force.getUseSwitchingFunction() and force.getSwitchingDistance() >= cutoff:
+                        self._exit("Error: NONBONDED_CUTOFF must be larger than the switching distance %s" % force.getSwitchingDistance())
+                    force.setCutoffDistance(cutoff)
+                    self.logger.info("Nonbonded cutoff set to %s" % cutoff)
+                if ewald_tol is not None:
+                    force.setEwaldErrorTolerance(ewald_tol)
+                    self.logger.info("Ewald error tolerance set to %s" % ewald_tol)
 
     def set_barostat(self,temperature,pressure,frequency):
         """
@@ -85,11 +248,23 @@ class OMMSystem(object):
         pressure : eg. 1*bar
         frequency : 0 - disable the barostat
 
+        A disabled barostat launches no kernel during MD. It is kept because the state
+        files store its MonteCarloPressure and MonteCarloTemperature parameters, and
+        OpenMM refuses to load them into a Context that does not define them.
         """
         self.barostat = MonteCarloBarostat(pressure, temperature)
         self.barostat.setFrequency(frequency)
         self.system.addForce(self.barostat)
 
+    def _add_state_hack_force(self):
+        #hack to store ASyncRE quantities in the openmm State
+        #the force has no particles and a constant zero energy, it only carries the global parameters
+        sforce = mm.CustomExternalForce("0")
+        addGlobalParameter = sforce.addGlobalParameter
+        for name in self.parameter.values():
+            addGlobalParameter(name, 0)
+        self.system.addForce(sforce)
+
     def free_force_group(self):
         freeGroups = set(range(32)) - set(force.getForceGroup() for force in self.system.getForces())
         if len(freeGroups) == 0:
@@ -102,26 +277,46 @@ class OMMSystem(object):
         nonbonded = [f for f in self.system.getForces() if isinstance(f, NonbondedForce)][0]
         self.nonbondedforcegroup = self.free_force_group()
         nonbonded.setForceGroup(self.nonbondedforcegroup)
-        #set the multiplicity of the calculation of bonded forces so that they are evaluated at least once every 1 fs (default time-step)
-        bonded_frequency = max(1, int(round(MDstepsize/defaultMDstepsize)))
-        self.logger.info("Running with a %f fs time-step with bonded forces integrated %d times per time-step" % (MDstepsize/femtosecond, bonded_frequency))
-        if doMetaD:
-            fgroups = [(0,bonded_frequency), (self.metaDforcegroup, bonded_frequency), (self.nonbondedforcegroup,1)]
+        self.integrator = self._make_integrator(temperature, frictionCoeff, MDstepsize, defaultMDstepsize, self.nonbondedforcegroup)
+
+    def _make_integrator(self, temperature, frictionCoeff, MDstepsize, defaultMDstepsize, outerforcegroup):
+        """
+        returns the integrator selected by the INTEGRATOR keyword
+
+        MTSLangevin (default): multiple time-step Langevin integrator, the forces in outerforcegroup
+                        are evaluated once per time-step, the bonded forces in group 0 at least
+                        once every defaultMDstepsize
+        LangevinMiddle: single time-step LangevinMiddleIntegrator, all forces evaluated at every step.
+                        It allows a 4 fs TIME_STEP with HBonds constraints when the system file is
+                        prepared with heavy hydrogens (--hmass 1.5)
+        """
+        integrator_name = self.keywords.get('INTEGRATOR')
+        if integrator_name is None or integrator_name.lower() == 'mtslangevin':
+            #set the multiplicity of the calculation of bonded forces so that they are evaluated at least once every 1 fs (default time-step)
+            bonded_frequency = max(1, int(round(MDstepsize/defaultMDstepsize)))
+            self.logger.info("Running with a %f fs time-step with bonded forces integrated %d times per time-step" % (MDstepsize/femtosecond, bonded_frequency))
+            if self.doMetaD:
+                fgroups = [(0,bonded_frequency), (self.metaDforcegroup, bonded_frequency), (outerforcegroup,1)]
+            else:
+                fgroups = [(0,bonded_frequency), (outerforcegroup,1)]
+            integrator = ATMMTSLangevinIntegrator(temperature, frictionCoeff, MDstepsize, fgroups)
+        elif integrator_name.lower() == 'langevinmiddle':
+            self.logger.info("Running with a %f fs time-step with the LangevinMiddle integrator, all forces are evaluated at every time-step" % (MDstepsize/femtosecond))
+            integrator = LangevinMiddleIntegrator(temperature, frictionCoeff, MDstepsize)
         else:
-            fgroups = [(0,bonded_frequency), (self.nonbondedforcegroup,1)]
-        self.integrator = ATMMTSLangevinIntegrator(temperature, frictionCoeff, MDstepsize, fgroups)
-        self.integrator.setConstraintTolerance(0.00001)
+            self._exit("Error: unknown INTEGRATOR %s" % integrator_name)
+        integrator.setConstraintTolerance(0.00001)
+        return integrator
 
     def set_positional_restraints(self):
         #indexes of the atoms whose position is restrained near the initial positions
         #by a flat-bottom harmonic potential. 
-        posrestr_atoms_list = self.keywords.get('POS_RESTRAINED_ATOMS')
+        posrestr_atoms = self._parse_atom_indices('POS_RESTRAINED_ATOMS')
         self.posrestrForce = None
-        if posrestr_atoms_list is not None:
-            posrestr_atoms = [int(i) for i in posrestr_atoms_list]
+        if posrestr_atoms is not None:
             fc = float(self.keywords.get('POSRE_FORCE_CONSTANT')) * (kilocalorie_per_mole/angstrom**2)
             tol = float(self.keywords.get('POSRE_TOLERANCE')) * angstrom
-            self.posrestrForce = self.atm_utils.addPosRestraints(posrestr_atoms, self.positions, fc, tol)
+            self.posrestrForce = self.atm_utils.addPosRestraints(posrestr_atoms.tolist(), self.positions, fc, tol)
 
     def set_torsion_metaDbias(self,temperature):
         if self.keywords.get('METADBIAS_DIR') == None:
@@ -177,15 +372,16 @@ class OMMSystemTRE(OMMSystem):
         #set barostat
         self.set_barostat(temperature,1*bar,0)
 
-        #hack to store ASyncRE quantities in the openmm State
-        sforce = mm.CustomBondForce("1")
-        for name in self.parameter:
-            sforce.addGlobalParameter(self.parameter[name], 0)
-        self.system.addForce(sforce)
+        self._add_state_hack_force()
 
         self.set_integrator(temperature, self.frictionCoeff, self.MDstepsize)
 
-class OMMSystemABFE(OMMSystem):
+class OMMSystemATM(OMMSystem):
+    """
+    common code of the ABFE and RBFE systems with the ATM Force
+    """
+    _required = OMMSystem._required + ('UMAX', 'ACORE', 'DISPLACEMENT')
+
     def __init__(self, basename, keywords, pdbtopfile, systemfile, logger):
         super().__init__(basename, keywords, pdbtopfile, systemfile, logger)
 
@@ -193,30 +389,95 @@ class OMMSystemABFE(OMMSystem):
         self.parameter['atmintermediate'] = 'REAlchemicalIntermediate'
         self.parameter['bias_energy'] = 'BiasEnergy'
         self.atmforce = None
+
+        #soft-core parameters are fixed (the same in all states)
+        self.umsc = float(self.keywords.get('UMAX')) * kilocalorie_per_mole
+        ubcore = self.keywords.get('UBCORE')
+        if ubcore:
+            self.ubcore = float(ubcore) * kilocalorie_per_mole
+        else:
+            self.ubcore = 0.0 * kilocalorie_per_mole
+        self.acore = float(self.keywords.get('ACORE'))
+
+        self.displ = np.fromstring(self.keywords.get('DISPLACEMENT'), sep=',', dtype=np.float64)*angstrom
+        if len(self.displ) != 3:
+            self._exit("Error: DISPLACEMENT requires 3 components")
+
+    def set_integrator(self, temperature, frictionCoeff, MDstepsize, defaultMDstepsize = 0.001*picosecond):
+        self.integrator = self._make_integrator(temperature, frictionCoeff, MDstepsize, defaultMDstepsize, self.atmforcegroup)
+
+    def load_system(self):
+        super().load_system()
+        #a single AtomUtils object is shared by all of the restraint setup methods
+        self.atm_utils = AtomUtils(self.system)
+
+    def get_atm_displacements(self, n_atoms):
+        """
+        returns a (n_atoms, 3) array with the displacements in nm of the ATMForce particles,
+        overriden for ABFE and RBFE
+        """
+        return np.zeros((n_atoms, 3), dtype=np.float64)
+
+    def set_atmforce(self):
+        #these define the state and will be overriden in set_state()
+        lmbd = 0.0
+        lambda1 = lmbd
+        lambda2 = lmbd
+        alpha = 0.0 / kilocalorie_per_mole
+        uh = 0.0 * kilocalorie_per_mole
+        w0coeff = 0.0 * kilocalorie_per_mole
+        direction = 1.0
+        #soft-core parameters in OpenMM units, converted once
+        umsc_kj = self.umsc.value_in_unit(kilojoules_per_mole)
+        ubcore_kj = self.ubcore.value_in_unit(kilojoules_per_mole)
+        acore = self.acore
+
+        #create ATM Force
+        self.atmforce = ATMForce(lambda1, lambda2,  alpha * kilojoules_per_mole, uh/kilojoules_per_mole, w0coeff/kilojoules_per_mole, umsc_kj, ubcore_kj, acore, direction )
+
+        #adds nonbonded Force from the system to the ATMForce
+        import re
+        nbpattern = re.compile(".*Nonbonded.*")
+        for i in range(self.system.getNumForces()):
+            if nbpattern.match(str(type(self.system.getForce(i)))):
+                self.atmforce.addForce(copy.copy(self.system.getForce(i)))
+                self.system.removeForce(i)
+                break
+
+        #adds atoms to ATMForce with their displacements in a single pass
+        n_atoms = self.topology.getNumAtoms()
+        addParticle = self.atmforce.addParticle
+        for (dx, dy, dz) in self.get_atm_displacements(n_atoms).tolist():
+            addParticle(Vec3(dx, dy, dz))
+
+        #assign a group to ATMForce for multiple time-steps
+        self.atmforcegroup = self.free_force_group()
+        self.atmforce.setForceGroup(self.atmforcegroup)
+
+        #add ATMForce to the system
+        self.system.addForce(self.atmforce)
+
+        #these are the global parameters specified in the cntl files that need to be reset
+        #by the worker after reading the first configuration
+        self.cparams[self.atmforce.Umax()] = umsc_kj
+        self.cparams[self.atmforce.Ubcore()] = ubcore_kj
+        self.cparams[self.atmforce.Acore()] = acore
+
+class OMMSystemABFE(OMMSystemATM):
+    _required = OMMSystemATM._required + ('LIGAND_ATOMS',)
+
+    def __init__(self, basename, keywords, pdbtopfile, systemfile, logger):
+        super().__init__(basename, keywords, pdbtopfile, systemfile, logger)
         self.lig_atoms = None
-        self.displ = None
 
     def set_ligand_atoms(self):
-        lig_atoms_in = self.keywords.get('LIGAND_ATOMS')   #indexes of ligand atoms
-        if lig_atoms_in is not None:
-            self.lig_atoms = [int(i) for i in lig_atoms_in]
-        else:
-            msg = "Error: LIGAND_ATOMS is required"
-            self._exit(msg)
+        self.lig_atoms = self._parse_atom_indices('LIGAND_ATOMS', required = True)   #indexes of ligand atoms
 
     def set_vsite_restraints(self):
         #CM-CM Vsite restraints
-        cm_lig_atoms = self.keywords.get('LIGAND_CM_ATOMS')   #indexes of ligand atoms for CM-CM Vsite restraint
-        if cm_lig_atoms is not None:
-            lig_atom_restr = [int(i) for i in cm_lig_atoms]
-        else:
-            lig_atom_restr = None
-        cm_rcpt_atoms = self.keywords.get('RCPT_CM_ATOMS')   #indexes of rcpt atoms for CM-CM Vsite restraint
-        if cm_rcpt_atoms is not None:
-            rcpt_atom_restr = [int(i) for i in cm_rcpt_atoms]
-        else:
-            rcpt_atom_restr = None
-        cmrestraints_present = (cm_rcpt_atoms is not None) and (cm_lig_atoms is not None)
+        self.lig_cm_atoms = self._parse_atom_indices('LIGAND_CM_ATOMS')   #indexes of ligand atoms for CM-CM Vsite restraint
+        self.rcpt_cm_atoms = self._parse_atom_indices('RCPT_CM_ATOMS')   #indexes of rcpt atoms for CM-CM Vsite restraint
+        cmrestraints_present = (self.rcpt_cm_atoms is not None) and (self.lig_cm_atoms is not None)
         self.vsiterestraintForce = None
         if cmrestraints_present:
             cmkf = float(self.keywords.get('CM_KF'))
@@ -225,9 +486,11 @@ class OMMSystemABFE(OMMSystem):
             r0 = cmtol * angstrom #radius of Vsite sphere
             ligoffset = self.keywords.get('LIGOFFSET')
             if ligoffset is not None:
-                ligoffset = [float(offset) for offset in ligoffset.split(',')]*angstrom
-            self.vsiterestraintForce = self.atm_utils.addVsiteRestraintForceCMCM(lig_cm_particles = lig_atom_restr,
-                                                                                 rcpt_cm_particles = rcpt_atom_restr,
+                ligoffset = np.fromstring(ligoffset, sep=',', dtype=np.float64)*angstrom
+            else:
+                ligoffset = np.zeros(3)*angstrom
+            self.vsiterestraintForce = self.atm_utils.addVsiteRestraintForceCMCM(lig_cm_particles = self.lig_cm_atoms.tolist(),
+                                                                                 rcpt_cm_particles = self.rcpt_cm_atoms.tolist(),
                                                                                  kfcm = kf,
                                                                                  tolcm = r0,
                                                                                  offset = ligoffset)
@@ -272,78 +535,14 @@ class OMMSystemABFE(OMMSystem):
                                                       kfphi, phi0, phitol,
                                                       kfpsi, psi0, psitol)
 
-    def set_integrator(self, temperature, frictionCoeff, MDstepsize, defaultMDstepsize = 0.001*picosecond):
-        #set the multiplicity of the calculation of bonded forces so that they are evaluated at least once every 1 fs (default time-step)
-        bonded_frequency = max(1, int(round(MDstepsize/defaultMDstepsize)))
-        self.logger.info("Running with a %f fs time-step with bonded forces integrated %d times per time-step" % (MDstepsize/femtosecond, bonded_frequency))
-        if self.doMetaD:
-            fgroups = [(0,bonded_frequency), (self.metaDforcegroup, bonded_frequency), (self.atmforcegroup,1)]
-        else:
-            fgroups = [(0,bonded_frequency), (self.atmforcegroup,1)]
-        self.integrator = ATMMTSLangevinIntegrator(temperature, frictionCoeff, MDstepsize, fgroups )
-        self.integrator.setConstraintTolerance(0.00001)
-
-    def set_atmforce(self):
-        #these define the state and will be overriden in set_state()
-        lmbd = 0.0
-        lambda1 = lmbd
-        lambda2 = lmbd
-        alpha = 0.0 / kilocalorie_per_mole
-        uh = 0.0 * kilocalorie_per_mole
-        w0coeff = 0.0 * kilocalorie_per_mole
-        direction = 1.0
-
-        #soft-core parameters are fixed (the same in all states)
-        umsc = float(self.keywords.get('UMAX')) * kilocalorie_per_mole
-        ubcore = self.keywords.get('UBCORE')
-        if ubcore is not None:
-            ubcore = float(ubcore) * kilocalorie_per_mole
-        else:
-            ubcore = 0.0 * kilocalorie_per_mole
-        acore = float(self.keywords.get('ACORE'))
-
-        if not (self.keywords.get('DISPLACEMENT') is None):
-            self.displ = [float(displ) for displ in self.keywords.get('DISPLACEMENT').split(',')]*angstrom
-        else:
-            msg = "Error: DISPLACEMENT is required"
-            self._exit(msg)
-
-        #create ATM Force
-        self.atmforce = ATMForce(lambda1, lambda2,  alpha * kilojoules_per_mole, uh/kilojoules_per_mole, w0coeff/kilojoules_per_mole, umsc/kilojoules_per_mole, ubcore/kilojoules_per_mole, acore, direction )
-
-        #adds nonbonded Force from the system to the ATMForce
-        import re
-        nbpattern = re.compile(".*Nonbonded.*")
-        for i in range(self.system.getNumForces()):
-            if nbpattern.match(str(type(self.system.getForce(i)))):
-                self.atmforce.addForce(copy.copy(self.system.getForce(i)))
-                self.system.removeForce(i)
-                break
-
-        #adds atoms to ATMForce
-        for i in range(self.topology.getNumAtoms()):
-            self.atmforce.addParticle(Vec3(0., 0., 0.))
-        for i in self.lig_atoms:
-            self.atmforce.setParticleParameters(i, Vec3(self.displ[0], self.displ[1], self.displ[2])/nanometer )
-
-        #assign a group to ATMForce for multiple time-steps
-        self.atmforcegroup = self.free_force_group()
-        self.atmforce.setForceGroup(self.atmforcegroup)
-
-        #add ATMForce to the system
-        self.system.addForce(self.atmforce)
-
-        #these are the global parameters specified in the cntl files that need to be reset
-        #by the worker after reading the first configuration
-        self.cparams[self.atmforce.Umax()] = umsc/kilojoules_per_mole
-        self.cparams[self.atmforce.Ubcore()] = ubcore/kilojoules_per_mole
-        self.cparams[self.atmforce.Acore()] = acore
+    def get_atm_displacements(self, n_atoms):
+        displ = super().get_atm_displacements(n_atoms)
+        displ[self.lig_atoms] = self.displ.value_in_unit(nanometer)
+        return displ
 
     def create_system(self):
         self.load_system()
 
-        self.atm_utils = AtomUtils(self.system)
-
         self.set_ligand_atoms()
 
         self.set_vsite_restraints()
@@ -361,76 +560,48 @@ class OMMSystemABFE(OMMSystem):
         pressure=1*bar
         self.set_barostat(temperature,pressure,0)
 
-        #hack to store ASyncRE quantities in the openmm State
-        sforce = mm.CustomBondForce("1")
-        for name in self.parameter:
-            sforce.addGlobalParameter(self.parameter[name], 0)
-        self.system.addForce(sforce)
+        self._add_state_hack_force()
 
         self.set_integrator(temperature, self.frictionCoeff, self.MDstepsize)
 
 
-class OMMSystemRBFE(OMMSystem):
+class OMMSystemRBFE(OMMSystemATM):
+    _required = OMMSystemATM._required + ('LIGAND1_ATOMS', 'LIGAND2_ATOMS')
+
     def __init__(self, basename, keywords, pdbtopfile, systemfile, logger):
         super().__init__(basename, keywords, pdbtopfile, systemfile, logger)
-
-        self.parameter['perturbation_energy'] = 'REPertEnergy'
-        self.parameter['atmintermediate'] = 'REAlchemicalIntermediate'
-        self.parameter['bias_energy'] = 'BiasEnergy'
-        self.atmforce = None
         self.lig1_atoms = None
         self.lig2_atoms = None
-        self.displ = None
 
     def set_ligand_atoms(self):
-        lig1_atoms_in = self.keywords.get('LIGAND1_ATOMS')   #indexes of ligand1 atoms
-        lig2_atoms_in = self.keywords.get('LIGAND2_ATOMS')   #indexes of ligand2 atoms
-        if lig1_atoms_in is not None:
-            self.lig1_atoms = [int(i) for i in lig1_atoms_in]
-        else:
-            msg = "Error: LIGAND1_ATOMS is required"
-            self._exit(msg)
-        if lig2_atoms_in is not None:
-            self.lig2_atoms = [int(i) for i in lig2_atoms_in ]
-        else:
-            msg = "Error: LIGAND2_ATOMS is required"
-            self._exit(msg)
+        self.lig1_atoms = self._parse_atom_indices('LIGAND1_ATOMS', required = True)   #indexes of ligand1 atoms
+        self.lig2_atoms = self._parse_atom_indices('LIGAND2_ATOMS', required = True)   #indexes of ligand2 atoms
 
     def set_displacement(self):
-        #set displacements and offsets for ligand 1 and ligand 2
-        if self.keywords.get('DISPLACEMENT') is not None:
-            self.displ = [float(displ) for displ in self.keywords.get('DISPLACEMENT').split(',')]*angstrom
-            self.lig1offset = [float(0.0*offset) for offset in self.displ/angstrom]*angstrom
-            self.lig2offset = [float(offset) for offset in self.displ/angstrom]*angstrom
-        else:
-            msg = "DISPLACEMENT is required"
-            self._exit(msg)
+        #set offsets for ligand 1 and ligand 2, the displacement is set in __init__
+        self.lig1offset = np.zeros(3)*angstrom
+        self.lig2offset = self.displ.in_units_of(angstrom)
+
+    def get_atm_displacements(self, n_atoms):
+        displ = super().get_atm_displacements(n_atoms)
+        displ_nm = self.displ.value_in_unit(nanometer)
+        displ[self.lig1_atoms] = displ_nm
+        displ[self.lig2_atoms] = -displ_nm
+        return displ
 
     def set_vsite_restraints(self):
         #ligand 1 Vsite restraint
-        cm_lig1_atoms = self.keywords.get('LIGAND1_CM_ATOMS')   #indexes of ligand atoms for CM-CM Vsite restraint
-        if cm_lig1_atoms is not None:
-            lig1_atom_restr = [int(i) for i in cm_lig1_atoms]
-        else:
-            lig1_atom_restr = None
+        self.lig1_cm_atoms = self._parse_atom_indices('LIGAND1_CM_ATOMS')   #indexes of ligand atoms for CM-CM Vsite restraint
 
         #ligand 2 Vsite restraint
-        cm_lig2_atoms = self.keywords.get('LIGAND2_CM_ATOMS')   #indexes of ligand atoms for CM-CM Vsite restraint
-        if cm_lig2_atoms is not None:
-            lig2_atom_restr = [int(i) for i in cm_lig2_atoms]
-        else:
-            lig2_atom_restr = None
+        self.lig2_cm_atoms = self._parse_atom_indices('LIGAND2_CM_ATOMS')   #indexes of ligand atoms for CM-CM Vsite restraint
 
         #Vsite restraint receptor atoms
-        cm_rcpt_atoms = self.keywords.get('RCPT_CM_ATOMS')   #indexes of rcpt atoms for CM-CM Vsite restraint
-        if cm_rcpt_atoms is None:
-            cm_rcpt_atoms = self.keywords.get('REST_LIGAND_CMREC_ATOMS')
-        if cm_rcpt_atoms is not None:
-            rcpt_atom_restr = [int(i) for i in cm_rcpt_atoms]
-        else:
-            rcpt_atom_restr = None
+        self.rcpt_cm_atoms = self._parse_atom_indices('RCPT_CM_ATOMS')   #indexes of rcpt atoms for CM-CM Vsite restraint
+        if self.rcpt_cm_atoms is None:
+            self.rcpt_cm_atoms = self._parse_atom_indices('REST_LIGAND_CMREC_ATOMS')
 
-        cmrestraints_present = (rcpt_atom_restr is not None) and (lig1_atom_restr is not None) and (lig2_atom_restr is not None)
+        cmrestraints_present = (self.rcpt_cm_atoms is not None) and (self.lig1_cm_atoms is not None) and (self.lig2_cm_atoms is not None)
 
         self.vsiterestraintForce1 = None
         self.vsiterestraintForce2 = None
@@ -441,13 +612,13 @@ class OMMSystemRBFE(OMMSystem):
             r0 = cmtol * angstrom #radius of Vsite sphere
 
             #Vsite restraints for ligands 1 and 2
-            self.vsiterestraintForce1 = self.atm_utils.addVsiteRestraintForceCMCM(lig_cm_particles = lig1_atom_restr,
-                                        rcpt_cm_particles = rcpt_atom_restr,
+            self.vsiterestraintForce1 = self.atm_utils.addVsiteRestraintForceCMCM(lig_cm_particles = self.lig1_cm_atoms.tolist(),
+                                        rcpt_cm_particles = self.rcpt_cm_atoms.tolist(),
                                         kfcm = kf,
                                         tolcm = r0,
                                         offset = self.lig1offset)
-            self.vsiterestraintForce2 = self.atm_utils.addVsiteRestraintForceCMCM(lig_cm_particles = lig2_atom_restr,
-                                        rcpt_cm_particles = rcpt_atom_restr,
+            self.vsiterestraintForce2 = self.atm_utils.addVsiteRestraintForceCMCM(lig_cm_particles = self.lig2_cm_atoms.tolist(),
+                                        rcpt_cm_particles = self.rcpt_cm_atoms.tolist(),
                                         kfcm = kf,
                                         tolcm = r0,
                                         offset = self.lig2offset)
@@ -527,16 +698,15 @@ class OMMSystemRBFE(OMMSystem):
         set reference atoms for adding the alignment force
 
         """
-        refatoms1_cntl = self.keywords.get('ALIGN_LIGAND1_REF_ATOMS')
-        refatoms2_cntl = self.keywords.get('ALIGN_LIGAND2_REF_ATOMS')
+        self.refatoms1 = self._parse_atom_indices('ALIGN_LIGAND1_REF_ATOMS')
+        self.refatoms2 = self._parse_atom_indices('ALIGN_LIGAND2_REF_ATOMS')
 
-        if refatoms1_cntl == None or refatoms2_cntl == None:
+        if self.refatoms1 is None or self.refatoms2 is None:
             return
 
-        self.refatoms1 = [int(refatoms1) for refatoms1 in refatoms1_cntl]
-        lig1_ref_atoms  = [ self.refatoms1[i]+self.lig1_atoms[0] for i in range(3)]
-        self.refatoms2 = [int(refatoms2) for refatoms2 in refatoms2_cntl]
-        lig2_ref_atoms  = [ self.refatoms2[i]+self.lig2_atoms[0] for i in range(3)]
+        #reference atoms are numbered from the first atom of each ligand
+        lig1_ref_atoms = (self.refatoms1[:3] + self.lig1_atoms[0]).tolist()
+        lig2_ref_atoms = (self.refatoms2[:3] + self.lig2_atoms[0]).tolist()
 
         #add alignment force
         self.atm_utils.addAlignmentForce(liga_ref_particles = lig1_ref_atoms,
@@ -546,74 +716,9 @@ class OMMSystemRBFE(OMMSystem):
                                     kpsi = float(self.keywords.get('ALIGN_K_PSI'))*kilocalorie_per_mole,
                                     offset = self.lig2offset)
 
-    def set_integrator(self, temperature, frictionCoeff, MDstepsize, defaultMDstepsize = 0.001*picosecond):
-        #set the multiplicity of the calculation of bonded forces so that they are evaluated at least once every 1 fs (default time-step)
-        bonded_frequency = max(1, int(round(MDstepsize/defaultMDstepsize)))
-        self.logger.info("Running with a %f fs time-step with bonded forces integrated %d times per time-step" % (MDstepsize/femtosecond, bonded_frequency))
-        if self.doMetaD:
-            fgroups = [(0,bonded_frequency), (self.metaDforcegroup, bonded_frequency), (self.atmforcegroup,1)]
-        else:
-            fgroups = [(0,bonded_frequency), (self.atmforcegroup,1)]
-        self.integrator = ATMMTSLangevinIntegrator(temperature, frictionCoeff, MDstepsize, fgroups )
-        self.integrator.setConstraintTolerance(0.00001)
-
-    def set_atmforce(self):
-        #these define the state and will be overriden in set_state()
-        temperature = 300 * kelvin
-        lmbd = 0.0
-        lambda1 = lmbd
-        lambda2 = lmbd
-        alpha = 0.0 / kilocalorie_per_mole
-        uh = 0.0 * kilocalorie_per_mole
-        w0coeff = 0.0 * kilocalorie_per_mole
-        direction = 1.0
-
-        #soft-core parameters are fixed (the same in all states)
-        umsc = float(self.keywords.get('UMAX')) * kilocalorie_per_mole
-        ubcore = self.keywords.get('UBCORE')
-        if ubcore:
-            ubcore = float(ubcore) * kilocalorie_per_mole
-        else:
-            ubcore = 0.0 * kilocalorie_per_mole
-        acore = float(self.keywords.get('ACORE'))
-
-        #create ATM Force
-        self.atmforce = ATMForce(lambda1, lambda2,  alpha * kilojoules_per_mole, uh/kilojoules_per_mole, w0coeff/kilojoules_per_mole, umsc/kilojoules_per_mole, ubcore/kilojoules_per_mole, acore, direction )
-
-        #adds nonbonded Force from the system to the ATMForce
-        import re
-        nbpattern = re.compile(".*Nonbonded.*")
-        for i in range(self.system.getNumForces()):
-            if nbpattern.match(str(type(self.system.getForce(i)))):
-                self.atmforce.addForce(copy.copy(self.system.getForce(i)))
-                self.system.removeForce(i)
-                break
-
-        #adds atoms to ATMForce
-        for i in range(self.topology.getNumAtoms()):
-            self.atmforce.addParticle( Vec3(0., 0., 0.))
-        for i in self.lig1_atoms:
-            self.atmforce.setParticleParameters(i,  Vec3(self.displ[0], self.displ[1], self.displ[2])/nanometer )
-        for i in self.lig2_atoms:
-            self.atmforce.setParticleParameters(i, -Vec3(self.displ[0], self.displ[1], self.displ[2])/nanometer )
-
-        #assign a group to ATMForce for multiple time-steps
-        self.atmforcegroup = self.free_force_group()
-        self.atmforce.setForceGroup(self.atmforcegroup)
-
-        #add ATMForce to the system
-        self.system.addForce(self.atmforce)
-
-        #these are the global parameters specified in the cntl files that need to be reset
-        #by the worker after reading the first configuration
-        self.cparams[self.atmforce.Umax()] = umsc/kilojoules_per_mole
-        self.cparams[self.atmforce.Ubcore()] = ubcore/kilojoules_per_mole
-        self.cparams[self.atmforce.Acore()] = acore
-
     def create_system(self):
 
         self.load_system()
-        self.atm_utils = AtomUtils(self.system)
         self.set_ligand_atoms()
         self.set_displacement()
         self.set_vsite_restraints()
@@ -634,10 +739,7 @@ class OMMSystemRBFE(OMMSystem):
         #add barostat
         pressure=1*bar
         self.set_barostat(temperature,pressure,0)
-        #hack to store ASyncRE quantities in the openmm State
-        sforce = mm.CustomBondForce("1")
-        for name in self.parameter:
-            sforce.addGlobalParameter(self.parameter[name], 0)
-        self.system.addForce(sforce)
+
+        self._add_state_hack_force()
 
         self.set_integrator(temperature, self.frictionCoeff, self.MDstepsize)
@@ -5,8 +5,10 @@ Multiprocessing job transport for AsyncRE/OpenMM
 """
 import os, re, sys, time, shutil, copy, random, signal
 import multiprocessing as mp
+from multiprocessing import shared_memory
 #from multiprocessing import Process, Queue, Event
 import logging
+import numpy as np
 
 import openmm as mm
 from openmm.app import *
@@ -79,6 +81,14 @@ class OMMWorker(object):
         self.logfile_p = None
         self.outfile_p = None
         self.nprnt = int(self.keywords.get('PRNT_FREQUENCY'))
+        #opt-in: positions and velocities are exchanged with the compute worker
+        #through a shared memory buffer rather than pickled through the queues
+        self.posvel_shm = None
+        self.posvel_natoms = None
+        shm_posvel = self.keywords.get('SHARED_MEMORY_POSVEL')
+        if self.compute and shm_posvel is not None and shm_posvel.lower() == 'yes':
+            self.posvel_natoms = self.ommsystem.get_num_atoms()
+            self.posvel_shm = shared_memory.SharedMemory(create=True, size=2*self.posvel_natoms*3*np.dtype(np.float64).itemsize)
         if self.compute:
             #compute workers are launched as subprocesses
             s = signal.signal(signal.SIGINT, signal.SIG_IGN) #so that children do not respond to ctrl-c
@@ -94,6 +104,10 @@ class OMMWorker(object):
             self._openmm_worker_makecontext()
             return 1
 
+    def _posvel_buffer(self):
+        #numpy view of the shared memory buffer: positions (nm) in [0], velocities (nm/ps) in [1]
+        return np.ndarray((2, self.posvel_natoms, 3), dtype=np.float64, buffer=self.posvel_shm.buf)
+
     def set_state(self, par):
         self._readySignal.wait()
         self._cmdq.put("SETSTATE")
@@ -110,6 +124,12 @@ class OMMWorker(object):
     def set_posvel(self, positions, velocities):
         self._startedSignal.wait()
         self._readySignal.wait()
+        if self.posvel_shm is not None:
+            posvel = self._posvel_buffer()
+            posvel[0] = positions.value_in_unit(nanometer)
+            posvel[1] = velocities.value_in_unit(nanometer/picosecond)
+            positions = None
+            velocities = None
         self._cmdq.put("SETPOSVEL")
         self._inq.put(positions)
         self._inq.put(velocities)
@@ -121,6 +141,11 @@ class OMMWorker(object):
         self._cmdq.put("GETPOSVEL")
         self.positions = self._outq.get()
         self.velocities = self._outq.get()
+        if self.posvel_shm is not None:
+            #same lists of Vec3 as the queue path, the callers access p.x, p.y, p.z
+            posvel = self._posvel_buffer()
+            self.positions = Quantity([Vec3(x,y,z) for (x,y,z) in posvel[0].tolist()], nanometer)
+            self.velocities = Quantity([Vec3(x,y,z) for (x,y,z) in posvel[1].tolist()], nanometer/picosecond)
         return (self.positions, self.velocities)
 
     # sets the reporters of the worker
@@ -144,6 +169,10 @@ class OMMWorker(object):
         self._p.terminate()
         self._p.join(10) #10s time-out
         self._p.exitcode
+        if self.posvel_shm is not None:
+            self.posvel_shm.close()
+            self.posvel_shm.unlink()
+            self.posvel_shm = None
 
     # is worker running?
     def is_running(self):
@@ -208,17 +237,14 @@ class OMMWorker(object):
                 self.platform = Platform.getPlatformByName(self.platform_name)
                 self.platform_properties["OpenCLPlatformIndex"] = str(self.platformId)
                 self.platform_properties["DeviceIndex"] = str(self.deviceId)
-                self.platform_properties["Precision"] = "mixed"
                 self.logger.info("Worker using OpenCL OpenMM platform")
             elif self.platform_name == "CUDA":
                 self.platform = Platform.getPlatformByName(self.platform_name)
                 self.platform_properties["DeviceIndex"] = str(self.deviceId)
-                self.platform_properties["Precision"] = "mixed"
                 self.logger.info("Worker using CUDA OpenMM platform")
             elif self.platform_name == "HIP":
                 self.platform = Platform.getPlatformByName(self.platform_name)
                 self.platform_properties["DeviceIndex"] = str(self.deviceId)
-                self.platform_properties["Precision"] = "mixed"
                 self.logger.info("Worker using HIP OpenMM platform")
             elif self.platform_name == "CPU":
                 self.platform = Platform.getPlatformByName(self.platform_name)
@@ -232,6 +258,8 @@ class OMMWorker(object):
         else:
             self.platform = Platform.getPlatformByName('Reference')
             self.logger.info("Worker using Reference OpenMM platform")
+        if self.platform is not None:
+            self.platform_properties.update(self.ommsystem.get_platform_properties(self.platform.getName()))
 
         self.simulation = Simulation(self.topology, self.system, self.integrator, self.platform, self.platform_properties)
         self.context = self.simulation.context
@@ -294,6 +322,10 @@ class OMMWorker(object):
             elif command == "SETPOSVEL":
                 self.positions = inq.get()
                 self.velocities = inq.get()
+                if self.posvel_shm is not None:
+                    posvel = self._posvel_buffer()
+                    self.positions = Quantity(posvel[0].copy(), nanometer)
+                    self.velocities = Quantity(posvel[1].copy(), nanometer/picosecond)
                 self.context.setPositions(self.positions)
                 self.context.setVelocities(self.velocities)
             elif command == "RUN":
@@ -318,10 +350,18 @@ class OMMWorker(object):
                 pot = self._worker_getenergy()
             elif command == "GETPOSVEL":
                 state = self.context.getState(getPositions=True, getVelocities=True)
-                self.positions = state.getPositions()
-                self.velocities = state.getVelocities()
-                outq.put(self.positions)
-                outq.put(self.velocities)
+                if self.posvel_shm is not None:
+                    #the data is in the buffer when the caller receives the queue items
+                    posvel = self._posvel_buffer()
+                    posvel[0] = state.getPositions(asNumpy=True).value_in_unit(nanometer)
+                    posvel[1] = state.getVelocities(asNumpy=True).value_in_unit(nanometer/picosecond)
+                    outq.put(None)
+                    outq.put(None)
+                else:
+                    self.positions = state.getPositions()
+                    self.velocities = state.getVelocities()
+                    outq.put(self.positions)
+                    outq.put(self.velocities)
             elif command == "FINISH":
                 if self.outfile_p is not None:
                     self.outfile_p.close()
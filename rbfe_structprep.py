@@ -28,7 +28,6 @@ class OMMSystemRBFEnoATM(OMMSystemRBFE):
     def create_system(self):
 
         self.load_system()
-        self.atm_utils = AtomUtils(self.system)
         self.set_ligand_atoms()
         self.set_displacement()
         self.set_vsite_restraints()
@@ -87,8 +86,7 @@ def do_mintherm(keywords, restrain_solutes, logger):
     platform_name = keywords.get("OPENMM_PLATFORM")
     if platform_name == None:
         platform_name = "CUDA"
-    if platform_name == "CUDA" or platform_name == "OpenCL" or platform_name == "HIP":
-        platform_properties["Precision"] = "mixed"
+    platform_properties.update(syst.get_platform_properties(platform_name))
     platform = Platform.getPlatformByName(platform_name)
     
     simulation = Simulation(syst.topology, syst.system, syst.integrator, platform, platform_properties)
@@ -196,8 +194,7 @@ def do_lambda_annealing(keywords, logger):
     platform_name = keywords.get("OPENMM_PLATFORM")
     if platform_name == None:
         platform_name = "CUDA"
-    if platform_name == "CUDA" or platform_name == "OpenCL" or platform_name == "HIP":
-        platform_properties["Precision"] = "mixed"
+    platform_properties.update(syst.get_platform_properties(platform_name))
     platform = Platform.getPlatformByName(platform_name)
     
     simulation = Simulation(syst.topology, syst.system, syst.integrator, platform, platform_properties)
@@ -314,8 +311,7 @@ def do_equil(keywords, logger):
     platform_name = keywords.get("OPENMM_PLATFORM")
     if platform_name == None:
         platform_name = "CUDA"
-    if platform_name == "CUDA" or platform_name == "OpenCL" or platform_name == "HIP":
-        platform_properties["Precision"] = "mixed"
+    platform_properties.update(syst.get_platform_properties(platform_name))
     platform = Platform.getPlatformByName(platform_name)
     
     simulation = Simulation(syst.topology, syst.system, syst.integrator, platform, platform_properties)
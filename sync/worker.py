@@ -28,7 +28,8 @@ class OMMWorkerATM:
                 Platform.loadPluginsFromDirectory(plugin_dir)
 
         platform = Platform.getPlatformByName("CUDA")
-        properties = {"DeviceIndex": device, "Precision": "mixed"}
+        properties = {"DeviceIndex": device}
+        properties.update(self.ommsystem.get_platform_properties("CUDA"))
         self.logger.info(f"Device: CUDA {device}")
 
         self.simulation = Simulation(self.topology, self.ommsystem.system, self.integrator, platform, properties)
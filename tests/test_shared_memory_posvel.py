@@ -0,0 +1,100 @@
+"""
+Exchange of positions and velocities through shared memory (SHARED_MEMORY_POSVEL = yes)
+
+The compute worker process is replaced by queues filled by the test, the
+replica update runs the same checks as with the queue transport.
+"""
+import os, sys, queue, threading, unittest
+from multiprocessing import shared_memory
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+    from openmm import Vec3
+    from openmm.unit import Quantity, nanometer, picosecond, kilojoule_per_mole
+    from ommworker import OMMWorker
+    from local_openmm_transport import LocalOpenMMTransport
+except ImportError:
+    OMMWorker = None
+
+class _Process(object):
+    def is_alive(self):
+        return True
+
+class _Replica(object):
+    def __init__(self):
+        self.cycle = 0
+        self.mdsteps = 0
+        self.positions = None
+        self.velocities = None
+        self.pot = None
+    def get_cycle(self):
+        return self.cycle
+    def set_cycle(self, cycle):
+        self.cycle = cycle
+    def get_mdsteps(self):
+        return self.mdsteps
+    def set_mdsteps(self, mdsteps):
+        self.mdsteps = mdsteps
+    def set_posvel(self, positions, velocities):
+        self.positions = positions
+        self.velocities = velocities
+    def set_energy(self, pot):
+        self.pot = pot
+
+@unittest.skipIf(OMMWorker is None, "openmm is not installed")
+class TestSharedMemoryPosVel(unittest.TestCase):
+
+    def setUp(self):
+        natoms = 3
+        #a worker without its compute process
+        worker = OMMWorker.__new__(OMMWorker)
+        worker._startedSignal = threading.Event()
+        worker._startedSignal.set()
+        worker._readySignal = threading.Event()
+        worker._readySignal.set()
+        worker._errorSignal = threading.Event()
+        worker._cmdq = queue.Queue()
+        worker._inq = queue.Queue()
+        worker._outq = queue.Queue()
+        worker._p = _Process()
+        worker.posvel_natoms = natoms
+        worker.posvel_shm = shared_memory.SharedMemory(create=True, size=2*natoms*3*np.dtype(np.float64).itemsize)
+        self.worker = worker
+        self.positions = Quantity([Vec3(0.1*i, 0.2*i, 0.3*i) for i in range(natoms)], nanometer)
+        self.velocities = Quantity([Vec3(-0.1*i, -0.2*i, -0.3*i) for i in range(natoms)], nanometer/picosecond)
+
+    def tearDown(self):
+        self.worker.posvel_shm.close()
+        self.worker.posvel_shm.unlink()
+
+    def test_update_replica(self):
+        worker = self.worker
+        worker.set_posvel(self.positions, self.velocities)
+        self.assertEqual(worker._cmdq.get(), "SETPOSVEL")
+        self.assertIsNone(worker._inq.get())
+        self.assertIsNone(worker._inq.get())
+        posvel = worker._posvel_buffer()
+        np.testing.assert_allclose(posvel[0], self.positions.value_in_unit(nanometer))
+        np.testing.assert_allclose(posvel[1], self.velocities.value_in_unit(nanometer/picosecond))
+
+        #replies of the compute worker to GETPOSVEL and GETENERGY
+        worker._outq.put(None)
+        worker._outq.put(None)
+        worker._outq.put({'potential_energy' : Quantity(1.0, kilojoule_per_mole)})
+
+        replica = _Replica()
+        job = {'openmm_worker' : worker, 'openmm_replica' : replica, 'nsteps' : 10, 'nprnt' : 100, 'ntrj' : 100}
+        self.assertEqual(LocalOpenMMTransport._update_replica(None, job), 0)
+        self.assertEqual(replica.mdsteps, 10)
+        for (p, p0) in zip(replica.positions.value_in_unit(nanometer), self.positions.value_in_unit(nanometer)):
+            self.assertIsInstance(p, Vec3)
+            self.assertAlmostEqual(p.x, p0.x)
+            self.assertAlmostEqual(p.z, p0.z)
+        for (v, v0) in zip(replica.velocities.value_in_unit(nanometer/picosecond), self.velocities.value_in_unit(nanometer/picosecond)):
+            self.assertIsInstance(v, Vec3)
+            self.assertAlmostEqual(v.y, v0.y)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -41,10 +41,8 @@ class AtomUtils(object):
         self.minor_ommversion = int(ommversion.version.split(".")[1])
 
         if fix_zero_LJparams:
-            import re
-            nbpattern = re.compile(".*Nonbonded.*")
             for force in self.system.getForces():
-                if nbpattern.match(str(type(force))):
+                if isinstance(force, mm.NonbondedForce):
                     self.fixZeroLJParams(force)
 
     def addRestraintForce(self,
@@ -730,12 +728,11 @@ class AtomUtils(object):
 
         self.system.addForce(posrestforce)
 
+        #unit conversions are done outside of the loop over the particles
+        fc1 = fc/(kilojoule_per_mole/nanometer**2)
+        tol1 = tol/nanometer
         for p in particles:
-            x0 = refpos[p][0]/nanometer
-            y0 = refpos[p][1]/nanometer
-            z0 = refpos[p][2]/nanometer
-            fc1 = fc/(kilojoule_per_mole/nanometer**2)
-            tol1 = tol/nanometer
+            (x0, y0, z0) = refpos[p].value_in_unit(nanometer)
             posrestforce.addParticle(p, np.array([x0, y0, z0, fc1, tol1], dtype=np.double)  )
         return posrestforce
 